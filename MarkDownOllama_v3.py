@@ -1,15 +1,14 @@
 import streamlit as st
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core.node_parser.text import SentenceSplitter
-from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
 from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core import StorageContext, load_index_from_storage
 import os
 import nest_asyncio
 
 #local Imports
+import inferenceBackend
 import webFetch
 import dataPrimer
 
@@ -31,13 +30,10 @@ Settings.llm = Ollama(
             Always provide detailed breakdown of the responses requested by the user"
     }
 )
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name="nomic-ai/nomic-embed-text-v1", trust_remote_code=True, 
-    cache_folder='./HFCache'
-)
+Settings.embed_model = inferenceBackend.get_embed_model()
 Settings.node_parser = SentenceSplitter(chunk_size=2048, chunk_overlap=20)
 
-rerank = FlagEmbeddingReranker(model="BAAI/bge-reranker-base", top_n=7)
+rerank = inferenceBackend.get_reranker(top_n=7)
 
 chatmemory = ChatMemoryBuffer.from_defaults(token_limit=8192)
 
@@ -78,8 +74,8 @@ def load_data():
             # Define the directory containing the Markdown files
             markdown_directory = 'markdown'
 
-            # Initialize SimpleDirectoryReader to read Markdown files
-            reader = SimpleDirectoryReader(markdown_directory, required_exts=[".md"])
+            # Initialize SimpleDirectoryReader to read the Markdown files of each product
+            reader = SimpleDirectoryReader(input_files=dataPrimer.product_markdown_files(markdown_directory))
 
             # Load documents from the directory
             documents = reader.load_data(show_progress=True, num_workers=4)
@@ -1,17 +1,17 @@
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.core import StorageContext, load_index_from_storage
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core.node_parser.text import SentenceSplitter
 
 import os
 import nest_asyncio
 
+#local Imports
+import inferenceBackend
+import dataPrimer
+
 nest_asyncio.apply()
 
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name="nomic-ai/nomic-embed-text-v1", trust_remote_code=True, 
-    cache_folder='./HFCache'
-)
+Settings.embed_model = inferenceBackend.get_embed_model()
 Settings.node_parser = SentenceSplitter(chunk_size=2048, chunk_overlap=20)
 
 
@@ -19,8 +19,8 @@ if __name__ == '__main__':
     # Define the directory containing the Markdown files
     markdown_directory = 'markdown'
 
-    # Initialize SimpleDirectoryReader to read Markdown files
-    reader = SimpleDirectoryReader(markdown_directory, required_exts=[".md"])
+    # Initialize SimpleDirectoryReader to read the Markdown files of each product
+    reader = SimpleDirectoryReader(input_files=dataPrimer.product_markdown_files(markdown_directory))
 
     # Load documents from the directory
     documents = reader.load_data(show_progress=True, num_workers=12)
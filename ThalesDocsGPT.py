@@ -4,10 +4,10 @@ from llama_index.llms.openai import OpenAI
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.node_parser.text import SentenceSplitter
 import openai
-from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
 from llama_index.core.memory import ChatMemoryBuffer
 
 #local Imports
+import inferenceBackend
 import webFetch
 import dataPrimer
 
@@ -25,7 +25,7 @@ system_prompt="""
 Settings.embed_model = OpenAIEmbedding(model="text-embedding-ada-002")
 Settings.node_parser = SentenceSplitter(chunk_size=2048, chunk_overlap=20)
 
-rerank = FlagEmbeddingReranker(model="BAAI/bge-reranker-base", top_n=7)
+rerank = inferenceBackend.get_reranker(top_n=7)
 
 chatmemory = ChatMemoryBuffer.from_defaults(token_limit=4096)
 
@@ -53,8 +53,8 @@ def load_data():
         # Define the directory containing the Markdown files
         markdown_directory = '../markdown'
 
-        # Initialize SimpleDirectoryReader to read Markdown files
-        reader = SimpleDirectoryReader(markdown_directory, required_exts=[".md"])
+        # Initialize SimpleDirectoryReader to read the Markdown files of each product
+        reader = SimpleDirectoryReader(input_files=dataPrimer.product_markdown_files(markdown_directory))
 
         # Load documents from the directory
         documents = reader.load_data(show_progress=True, num_workers=12)
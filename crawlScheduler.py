@@ -0,0 +1,295 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlparse
+
+
+class CrawlError(Exception):
+    """
+    A failed page fetch, carrying what the scheduler needs to decide on a retry.
+
+    Parameters:
+    message (str): A description of the failure.
+    status (int): The HTTP status code, or None if no response was received.
+    retryable (bool): Whether the fetch may succeed if attempted again.
+    congestion (bool): Whether the failure signals the host is overloaded (429, 5xx, timeout, dropped connection).
+    retry_after (float): The delay in seconds requested by the server, if any.
+    """
+
+    def __init__(self, message, status=None, retryable=True, congestion=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.congestion = congestion
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter allowing `rate` requests per second with bursts of up to `capacity`.
+
+    The rate can be changed while in use, and the bucket can be paused to stop
+    all requests to the host for a while (e.g. when the server sends Retry-After).
+
+    Parameters:
+    rate (float): The number of tokens added per second.
+    capacity (int): The maximum number of tokens the bucket holds.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for the given number of seconds, discarding any saved-up burst.
+
+        Parameters:
+        seconds (float): How long to pause the host.
+
+        Returns:
+        None
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it.
+
+        Returns:
+        None
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    # No tokens accrue while paused
+                    self.updated = time.monotonic()
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AIMDController:
+    """
+    Adaptive request rate and concurrency for a host using additive increase /
+    multiplicative decrease.
+
+    After a full window of healthy requests (fast and successful) the token
+    bucket rate grows by `rate_step` and the concurrency limit by one; on a
+    congestion signal (429, 5xx, timeout or dropped connection) both are halved.
+    Decreases are rate limited to one per `cooldown` seconds so a single burst
+    of failures does not collapse the limits to their minimum.
+
+    Parameters:
+    bucket (TokenBucket): The host's rate limiter, whose rate is adjusted.
+    initial (int): The starting concurrency limit.
+    minimum (int): The lowest concurrency limit.
+    maximum (int): The highest concurrency limit.
+    min_rate (float): The lowest request rate per second.
+    max_rate (float): The highest request rate per second.
+    rate_step (float): The request rate per second added after a healthy window.
+    latency_threshold (float): The request latency in seconds above which a success is not counted as healthy.
+    cooldown (float): The minimum number of seconds between two decreases.
+    """
+
+    def __init__(self, bucket, initial, minimum, maximum, min_rate, max_rate, rate_step,
+                 latency_threshold, cooldown=5.0):
+        self.bucket = bucket
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.healthy = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        """
+        Wait until the number of in-flight requests is below the current limit and take a slot.
+
+        Returns:
+        None
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, latency=None, congestion=False):
+        """
+        Release a slot and adjust the rate and concurrency limit from the request outcome.
+
+        Parameters:
+        latency (float): The request latency in seconds, or None if the request failed.
+        congestion (bool): Whether the request failed with a congestion signal.
+
+        Returns:
+        None
+        """
+        async with self.condition:
+            self.in_flight -= 1
+            if congestion:
+                now = time.monotonic()
+                if now - self.last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+                    self.last_decrease = now
+                    print(f"Backing off: {self.bucket.rate:.2f} req/s, concurrency limit {self.limit}")
+                self.healthy = 0
+            elif latency is not None and latency <= self.latency_threshold:
+                self.healthy += 1
+                if self.healthy >= self.limit and (self.limit < self.maximum or self.bucket.rate < self.max_rate):
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self.bucket.rate = min(self.max_rate, self.bucket.rate + self.rate_step)
+                    self.healthy = 0
+                    print(f"Healthy: {self.bucket.rate:.2f} req/s, concurrency limit {self.limit}")
+            self.condition.notify_all()
+
+
+class CrawlScheduler:
+    """
+    Per-host crawl scheduler combining a token-bucket rate limit and a
+    concurrency limit, both adapted by AIMD, jittered exponential backoff for
+    retries and a dead-letter list for URLs that could not be fetched.
+
+    Parameters:
+    settings (dict): The 'scheduler' section of the crawl configuration.
+    """
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.initial_concurrency = settings.get('initial_concurrency', 2)
+        self.min_concurrency = settings.get('min_concurrency', 1)
+        self.max_concurrency = settings.get('max_concurrency', 8)
+        self.rate_per_second = settings.get('rate_per_second', 2.0)
+        self.min_rate_per_second = settings.get('min_rate_per_second', 0.2)
+        self.max_rate_per_second = settings.get('max_rate_per_second', 8.0)
+        self.rate_step = settings.get('rate_step', 0.5)
+        self.burst = settings.get('burst', 4)
+        self.latency_threshold = settings.get('latency_threshold', 5.0)
+        self.max_retries = settings.get('max_retries', 3)
+        self.backoff_base = settings.get('backoff_base', 1.0)
+        self.backoff_max = settings.get('backoff_max', 60.0)
+        self.timeout = settings.get('timeout', 30.0)
+        self.hosts = {}
+        self.dead_letter = []
+
+    def _host(self, url):
+        """
+        Get the rate limiter and concurrency controller for the host of a URL.
+
+        Parameters:
+        url (str): The URL about to be fetched.
+
+        Returns:
+        tuple: The host's TokenBucket and AIMDController.
+        """
+        host = urlparse(url).netloc
+        if host not in self.hosts:
+            bucket = TokenBucket(self.rate_per_second, self.burst)
+            self.hosts[host] = (
+                bucket,
+                AIMDController(bucket, self.initial_concurrency, self.min_concurrency,
+                               self.max_concurrency, self.min_rate_per_second,
+                               self.max_rate_per_second, self.rate_step, self.latency_threshold),
+            )
+        return self.hosts[host]
+
+    async def run(self, url, fetch):
+        """
+        Fetch a URL once within the host's rate and concurrency limits.
+
+        A Retry-After from the server pauses the whole host, not only this URL.
+
+        Parameters:
+        url (str): The URL to fetch.
+        fetch (coroutine function): Called with the URL; raises CrawlError (or any exception) on failure.
+
+        Returns:
+        Any: The result of `fetch`.
+        """
+        bucket, controller = self._host(url)
+        # Take the token first so requests waiting on the rate limit don't count as in flight
+        await bucket.acquire()
+        await controller.acquire()
+        start = time.monotonic()
+        try:
+            result = await fetch(url)
+        except CrawlError as e:
+            if e.retry_after is not None:
+                bucket.pause(min(e.retry_after, self.backoff_max))
+            await controller.release(congestion=e.congestion)
+            raise
+        except BaseException:
+            await controller.release()
+            raise
+        await controller.release(latency=time.monotonic() - start)
+        return result
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """
+        Compute the delay before retrying, using exponential backoff with full jitter.
+
+        Parameters:
+        attempt (int): The number of attempts made so far (1 for the first failure).
+        retry_after (float): The delay in seconds requested by the server, if any.
+
+        Returns:
+        float: The number of seconds to wait before the next attempt.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def should_retry(self, error, attempt):
+        """
+        Decide whether a failed URL should be retried.
+
+        Parameters:
+        error (Exception): The failure raised by the fetch.
+        attempt (int): The number of attempts made so far.
+
+        Returns:
+        bool: True if the URL should be attempted again.
+        """
+        if isinstance(error, CrawlError) and not error.retryable:
+            return False
+        return attempt <= self.max_retries
+
+    def add_dead_letter(self, url, error, attempt, product=None):
+        """
+        Record a URL that could not be fetched.
+
+        Parameters:
+        url (str): The URL that failed.
+        error (Exception): The last failure raised by the fetch.
+        attempt (int): The number of attempts made.
+        product (str): The name of the product the URL belongs to.
+
+        Returns:
+        None
+        """
+        print(f"Giving up on {url} after {attempt} attempt(s): {error}")
+        self.dead_letter.append({
+            'url': url,
+            'product': product,
+            'attempts': attempt,
+            'status': getattr(error, 'status', None),
+            'error': str(error),
+        })
@@ -1,86 +1,420 @@
 import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+import argparse
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import json
 import re
 import os
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urldefrag
+from xml.etree import ElementTree
 import markdown
+import requests
 from bs4 import BeautifulSoup
 
-# Scraping function
-async def scrape_page(page, start_url):
+#local Imports
+from crawlScheduler import CrawlScheduler, CrawlError
+
+# Crawl configuration
+def load_crawl_config(config_path='crawlConfig.json'):
+    """
+    Load the crawl configuration listing the products to crawl.
+
+    Each product entry has a name, a list of start URLs, a URL scope prefix,
+    an optional sitemap URL and include/exclude regex patterns. If no sitemap
+    is given, '<scheme>://<host>/sitemap.xml' of the first start URL is tried.
+
+    Parameters:
+    config_path (str): The path to the JSON crawl configuration file.
+
+    Returns:
+    dict: The configuration with 'output_dir' and the normalized 'products' list.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    config.setdefault('output_dir', 'markdown')
+    config.setdefault('dead_letter_file', 'crawlDeadLetter.json')
+    for product in config['products']:
+        if not product.get('start_urls'):
+            raise ValueError(f"Product '{product.get('name')}' has no start_urls")
+        product.setdefault('scope', product['start_urls'][0])
+        if not product.get('sitemap'):
+            parsed_url = urlparse(product['start_urls'][0])
+            product['sitemap'] = f"{parsed_url.scheme}://{parsed_url.netloc}/sitemap.xml"
+        product['include'] = [re.compile(pattern) for pattern in product.get('include', [])]
+        product['exclude'] = [re.compile(pattern) for pattern in product.get('exclude', [])]
+
+    return config
+
+def product_markdown_files(output_dir=None, config_path=None):
+    """
+    List the markdown files of the configured products.
+
+    Only the per-product sub-directories are read, so flat markdown files left
+    in the output directory by older crawls are not indexed alongside them.
+
+    Parameters:
+    output_dir (str): The base directory of the markdown files. Default is None (the configured output_dir).
+    config_path (str): The path to the JSON crawl configuration file. Default is None, which uses the
+    'crawlConfig.json' next to `output_dir` (or in the working directory if no `output_dir` is given).
+
+    Returns:
+    list: The paths of the markdown files, sorted.
+
+    Raises:
+    FileNotFoundError: If none of the product directories contain markdown files.
+    """
+    if config_path is None:
+        config_dir = os.path.dirname(os.path.abspath(output_dir)) if output_dir else ''
+        config_path = os.path.join(config_dir, 'crawlConfig.json')
+    config = load_crawl_config(config_path)
+    output_dir = output_dir or config['output_dir']
+
+    product_dirs = [os.path.join(output_dir, product['name']) for product in config['products']]
+    missing = [directory for directory in product_dirs if not os.path.isdir(directory)]
+    files = sorted(
+        os.path.join(root, file)
+        for directory in product_dirs
+        for root, _, filenames in os.walk(directory)
+        for file in filenames if file.endswith('.md')
+    )
+
+    if not files:
+        raise FileNotFoundError(
+            f"No crawled markdown found for the products in {config_path} (missing: {', '.join(missing) or 'none'}). "
+            f"Run `python3 dataPrimer.py` to crawl them into {output_dir}/<product>."
+        )
+    if missing:
+        print(f"Skipping products that have not been crawled yet: {', '.join(missing)}")
+
+    return files
+
+def is_in_scope(url, product):
     """
-    Scrape the content of a webpage and follow its links to scrape more pages.
+    Check whether a URL belongs to a product's crawl scope.
+
+    Parameters:
+    url (str): The URL to check.
+    product (dict): The product entry from the crawl configuration.
+
+    Returns:
+    bool: True if the URL is under the product scope, matches an include pattern
+    (when any are given) and matches no exclude pattern.
+    """
+    if not url.startswith(product['scope']):
+        return False
+    if product['include'] and not any(pattern.match(url) for pattern in product['include']):
+        return False
+    return not any(pattern.match(url) for pattern in product['exclude'])
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header given as a number of seconds or as an HTTP date.
+
+    Parameters:
+    value (str): The header value, or None if the header is absent.
+
+    Returns:
+    float: The delay in seconds, or None if the header is absent or not understood.
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def get_sitemap(sitemap_url):
+    """
+    Download and parse a sitemap.
+
+    Parameters:
+    sitemap_url (str): The URL of the sitemap.xml (or sitemap index) to read.
+
+    Returns:
+    xml.etree.ElementTree.Element: The root element of the sitemap.
+
+    Raises:
+    CrawlError: If the server responds with 429 or a 5xx status.
+    """
+    response = requests.get(sitemap_url, timeout=10)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise CrawlError(f"HTTP {response.status_code}", status=response.status_code, congestion=True,
+                         retry_after=parse_retry_after(response.headers.get('retry-after')))
+    response.raise_for_status()
+    return ElementTree.fromstring(response.content)
+
+async def fetch_sitemap_urls(sitemap_url, scheduler, max_depth=3):
+    """
+    Fetch all page URLs listed in a sitemap, following nested sitemap indexes.
+
+    Requests go through the scheduler so they share the host's rate and concurrency limits.
+
+    Parameters:
+    sitemap_url (str): The URL of the sitemap.xml (or sitemap index) to read.
+    scheduler (CrawlScheduler): The scheduler limiting requests per host.
+    max_depth (int): The maximum number of nested sitemap indexes to follow. Default is 3.
+
+    Returns:
+    list: A list of page URLs, or an empty list if the sitemap is unavailable.
+    """
+    try:
+        root = await scheduler.run(sitemap_url, lambda u: asyncio.to_thread(get_sitemap, u))
+    except (CrawlError, requests.exceptions.RequestException, ElementTree.ParseError) as e:
+        print(f"No usable sitemap at {sitemap_url}: {e}")
+        return []
+
+    # Sitemap tags are namespaced, so match on the local tag name only
+    locations = [el.text.strip() for el in root.iter() if el.tag.endswith('loc') and el.text]
+
+    if root.tag.endswith('sitemapindex'):
+        if max_depth <= 0:
+            return []
+        nested = await asyncio.gather(*(fetch_sitemap_urls(location, scheduler, max_depth - 1)
+                                        for location in locations))
+        return [url for urls in nested for url in urls]
+
+    return locations
+
+def url_to_filename(url, output_dir):
+    """
+    Generate the markdown filename for a scraped URL.
+
+    Parameters:
+    url (str): The scraped URL.
+    output_dir (str): The directory the markdown file is written to.
+
+    Returns:
+    str: The path of the markdown file.
+    """
+    parsed_url = urlparse(url)
+    return os.path.join(output_dir, parsed_url.path.lstrip('/').replace('/', '_').replace('.html', '') + '.md')
+
+# Browser network errors that mean the host is refusing or dropping connections
+CONNECTION_ERRORS = (
+    'net::ERR_CONNECTION_RESET',
+    'net::ERR_CONNECTION_REFUSED',
+    'net::ERR_CONNECTION_CLOSED',
+    'net::ERR_CONNECTION_TIMED_OUT',
+    'net::ERR_EMPTY_RESPONSE',
+    'net::ERR_TIMED_OUT',
+)
+
+# Browser errors that mean the page itself is unusable and must be replaced
+PAGE_CRASH_ERRORS = (
+    'crashed',
+    'has been closed',
+    'Target closed',
+)
+
+class PageCrashError(CrawlError):
+    """
+    The browser page crashed or was closed; the URL is retried on a fresh page.
+    """
+
+# Scraping functions
+async def fetch_page(page, url, timeout):
+    """
+    Load a webpage and collect its content and links.
 
     Parameters:
     page (playwright.async_api.Page): The Playwright page object to interact with the web page.
-    start_url (str): The starting URL to scrape.
+    url (str): The URL to load.
+    timeout (float): The navigation timeout in seconds.
+
+    Returns:
+    tuple: The page HTML content and a list of the link URLs found on the page.
+
+    Raises:
+    CrawlError: If the page times out, the connection fails, the URL is not an HTML
+    page or the server responds with an HTTP error.
+    PageCrashError: If the browser page crashed or was closed.
+    """
+    try:
+        response = await page.goto(url, timeout=timeout * 1000)
+
+        status = response.status if response else None
+        if status is not None and (status == 429 or status >= 500):
+            raise CrawlError(f"HTTP {status}", status=status, congestion=True,
+                             retry_after=parse_retry_after(response.headers.get('retry-after')))
+        if status is not None and status >= 400:
+            raise CrawlError(f"HTTP {status}", status=status, retryable=False)
+
+        content_type = response.headers.get('content-type', '') if response else ''
+        if content_type and 'html' not in content_type:
+            raise CrawlError(f"Not an HTML page ({content_type})", status=status, retryable=False)
+
+        content = await page.content()
+        links = await page.eval_on_selector_all('a', 'elements => elements.map(el => el.href)')
+        return content, links
+    except PlaywrightTimeoutError as e:
+        raise CrawlError(f"Timed out after {timeout}s", congestion=True) from e
+    except PlaywrightError as e:
+        if 'Download is starting' in str(e):
+            raise CrawlError("Not an HTML page (download)", retryable=False) from e
+        if any(error in str(e) for error in CONNECTION_ERRORS):
+            raise CrawlError(f"Connection failed: {e}", congestion=True) from e
+        if any(error in str(e) for error in PAGE_CRASH_ERRORS):
+            raise PageCrashError(f"Page crashed or closed: {e}") from e
+        raise
+
+async def scrape_page(browser, product, output_dir, scheduler, sitemap_urls=()):
+    """
+    Scrape all pages of a product, starting from its sitemap and start URLs and
+    following links that stay within the product scope.
+
+    Pages are fetched by a pool of workers whose concurrency and request rate are
+    governed by the scheduler. Failed URLs are retried with backoff and end up in
+    the scheduler's dead-letter list once they run out of attempts.
+
+    Parameters:
+    browser (playwright.async_api.Browser): The Playwright browser used to open pages.
+    product (dict): The product entry from the crawl configuration.
+    output_dir (str): The directory the product's markdown files are written to.
+    scheduler (CrawlScheduler): The scheduler shared by all products.
+    sitemap_urls (list): The URLs listed in the product's sitemap. Default is () (no sitemap).
 
     Returns:
     None
     """
     visited = set()
-    queue = [start_url]
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp')
+    queue = asyncio.Queue()
+    retries = set()
 
-    while queue:
-        url = queue.pop(0)
-        if url in visited:
-            continue
-        visited.add(url)
+    def enqueue(url):
+        if url not in visited:
+            visited.add(url)
+            queue.put_nowait((url, 0))
 
-        print(f"Scraping URL: {url}")
+    async def retry_later(url, attempt, delay):
+        await asyncio.sleep(delay)
+        queue.put_nowait((url, attempt))
+        # Only mark the failed attempt done once its retry is queued, so join() keeps waiting
+        queue.task_done()
 
+    async def worker():
+        page = None
         try:
-            await page.goto(url)
-            content = await page.content()
+            while True:
+                url, attempt = await queue.get()
+                retrying = False
+                print(f"[{product['name']}] Scraping URL: {url}")
 
-            # Generate filename from URL
-            parsed_url = urlparse(url)
-            filename = os.path.join('markdown', parsed_url.path.lstrip('/').replace('/', '_').replace('.html', '') + '.md')
+                try:
+                    if page is None:
+                        page = await browser.new_page()
+                    content, links = await scheduler.run(url, lambda u: fetch_page(page, u, scheduler.timeout))
 
-            # Create directory if not exists
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
+                    # Generate filename from URL
+                    filename = url_to_filename(url, output_dir)
 
-            # Write the URL and content to the markdown file
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f'## URL: {url}\n\n')
-                f.write(f'### Content:\n\n')
-                f.write(f'{content}\n\n')
+                    # Create directory if not exists
+                    os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-            # Find all links on the page
-            links = await page.eval_on_selector_all('a', 'elements => elements.map(el => el.href)')
+                    # Write the URL and content to the markdown file
+                    with open(filename, 'w', encoding='utf-8') as f:
+                        f.write(f'## URL: {url}\n\n')
+                        f.write(f'### Content:\n\n')
+                        f.write(f'{content}\n\n')
 
-            for link in links:
-                # Ensure we only visit links within the same domain and skip image links
-                if re.match(r'https://www\.thalesdocs\.com/ctp/cm/latest/.*', link) and not link.endswith(image_extensions):
-                    if link not in visited:
-                        queue.append(link)
+                    for link in links:
+                        # SVG <a> elements give a non-string href
+                        if not isinstance(link, str):
+                            continue
+                        # Drop fragments so in-page anchors don't count as new pages
+                        link = urldefrag(link).url
+                        if is_in_scope(link, product):
+                            enqueue(link)
+                except Exception as e:
+                    # Replace a crashed or closed page (or one in an unknown state) so the next URL gets a fresh one
+                    if page is not None and (not isinstance(e, CrawlError) or isinstance(e, PageCrashError)
+                                             or page.is_closed()):
+                        try:
+                            await page.close()
+                        except Exception:
+                            pass
+                        page = None
 
-        except Exception as e:
-            print(f"Failed to scrape {url}: {e}")
+                    attempt += 1
+                    if scheduler.should_retry(e, attempt):
+                        delay = scheduler.backoff_delay(attempt, getattr(e, 'retry_after', None))
+                        print(f"Failed to scrape {url}: {e} (retry {attempt} in {delay:.1f}s)")
+                        task = asyncio.create_task(retry_later(url, attempt, delay))
+                        retries.add(task)
+                        task.add_done_callback(retries.discard)
+                        retrying = True
+                    else:
+                        scheduler.add_dead_letter(url, e, attempt, product['name'])
+                finally:
+                    # A retried item is marked done by retry_later once it is queued again
+                    if not retrying:
+                        queue.task_done()
+        finally:
+            if page is not None:
+                await page.close()
 
-async def scrape_all(urls):
+    for url in product['start_urls']:
+        enqueue(url)
+
+    # Seed the frontier from the sitemap so pages are found without a full link walk
+    seeded = [url for url in sitemap_urls if is_in_scope(url, product)]
+    print(f"[{product['name']}] Seeded {len(seeded)} URLs from sitemap {product['sitemap']}")
+    for url in seeded:
+        enqueue(url)
+
+    # Start as many workers as the scheduler may ever allow; its limit decides how many run at once
+    workers = [asyncio.create_task(worker()) for _ in range(scheduler.max_concurrency)]
+    join = asyncio.create_task(queue.join())
+    try:
+        # Workers only stop by failing, so a finished worker means the pool is broken
+        done, _ = await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+        if join not in done:
+            failed = next(task for task in workers if task in done)
+            raise RuntimeError(f"[{product['name']}] Crawl worker stopped unexpectedly") from failed.exception()
+    finally:
+        for task in [join, *workers, *retries]:
+            task.cancel()
+        await asyncio.gather(join, *workers, *retries, return_exceptions=True)
+
+async def scrape_all(products, output_dir='markdown', scheduler=None):
     """
-    Scrape multiple webpages concurrently.
+    Scrape multiple products concurrently, each into its own sub-directory.
 
     Parameters:
-    urls (list): A list of URLs to scrape.
+    products (list): A list of product entries from the crawl configuration.
+    output_dir (str): The base directory for the markdown files. Default is 'markdown'.
+    scheduler (CrawlScheduler): The scheduler limiting requests per host. Default is None (default settings).
 
     Returns:
-    None
+    list: The dead-letter entries for URLs that could not be scraped.
     """
+    scheduler = scheduler or CrawlScheduler()
+
+    # Products often share the host-level sitemap, so fetch each distinct sitemap only once
+    sitemaps = sorted({product['sitemap'] for product in products})
+    sitemap_urls = dict(zip(sitemaps, await asyncio.gather(
+        *(fetch_sitemap_urls(sitemap, scheduler) for sitemap in sitemaps))))
+
     async with async_playwright() as p:
         browser = await p.chromium.launch()
 
         tasks = []
-        for url in urls:
-            page = await browser.new_page()
-            tasks.append(scrape_page(page, url))
+        for product in products:
+            tasks.append(scrape_page(browser, product, os.path.join(output_dir, product['name']), scheduler,
+                                     sitemap_urls[product['sitemap']]))
 
         await asyncio.gather(*tasks)
         await browser.close()
 
+    return scheduler.dead_letter
+
 # Markdown cleanup function
 def clean_markdown_file(file_path, is_file=True):
     """
@@ -187,24 +521,40 @@ def clean_markdown_directory(directory, max_workers=(os.cpu_count()-4)):
             except Exception as e:
                 print(f"Exception occurred while processing {file}: {e}")
 
-async def main(urls):
+async def main(config_path='crawlConfig.json', product_names=None):
     """
-    The main function to scrape multiple URLs and clean up the resulting markdown files.
+    The main function to scrape the configured products and clean up the resulting markdown files.
 
     Parameters:
-    urls (list): A list of URLs to scrape.
+    config_path (str): The path to the JSON crawl configuration file. Default is 'crawlConfig.json'.
+    product_names (list): The names of the products to crawl. Default is None (all products).
 
     Returns:
     None
     """
+    config = load_crawl_config(config_path)
+    products = config['products']
+    if product_names:
+        unknown = set(product_names) - {product['name'] for product in products}
+        if unknown:
+            raise ValueError(f"Unknown product(s) {sorted(unknown)}, not in {config_path}")
+        products = [product for product in products if product['name'] in product_names]
+
     # Run the scraping first
-    await scrape_all(urls)
-    # Run the markdown cleanup
-    await asyncio.to_thread(clean_markdown_directory, 'markdown', max_workers=(os.cpu_count()-2))
+    dead_letter = await scrape_all(products, config['output_dir'], CrawlScheduler(config.get('scheduler')))
+
+    # Record the URLs that could not be scraped so they can be inspected or re-crawled
+    with open(config['dead_letter_file'], 'w', encoding='utf-8') as f:
+        json.dump(dead_letter, f, indent=4)
+    print(f"{len(dead_letter)} URL(s) failed, see {config['dead_letter_file']}")
+    # Run the markdown cleanup for the crawled products only
+    for product in products:
+        await asyncio.to_thread(clean_markdown_directory, os.path.join(config['output_dir'], product['name']),
+                                max_workers=(os.cpu_count()-2))
 
 if __name__ == '__main__':
-    urls = [
-        'https://www.thalesdocs.com/ctp/cm/latest/',
-        # Add more URLs as needed
-    ]
-    asyncio.run(main(urls))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Crawl ThalesDocs products into markdown files.')
+    parser.add_argument('--config', default='crawlConfig.json', help='Path to the crawl configuration file')
+    parser.add_argument('--products', nargs='*', help='Names of the products to crawl (default: all)')
+    args = parser.parse_args()
+    asyncio.run(main(args.config, args.products))
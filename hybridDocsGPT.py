@@ -1,8 +1,6 @@
 import streamlit as st
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
 from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core import StorageContext, load_index_from_storage
 from llama_index.core.node_parser.text import SentenceSplitter
@@ -11,6 +9,7 @@ import os
 import nest_asyncio
 
 #local Imports
+import inferenceBackend
 import webFetch
 import dataPrimer
 
@@ -28,13 +27,10 @@ system_prompt="""
     Ensure that your answers are comprehensive and cover all possible details.
     Do not ask the user to check the website for more details; include all necessary information in your response.
     """)
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name="nomic-ai/nomic-embed-text-v1", trust_remote_code=True, 
-    cache_folder='./HFCache'
-)
+Settings.embed_model = inferenceBackend.get_embed_model()
 Settings.node_parser = SentenceSplitter(chunk_size=2048, chunk_overlap=20)
 
-rerank = FlagEmbeddingReranker(model="BAAI/bge-reranker-base", top_n=7)
+rerank = inferenceBackend.get_reranker(top_n=7)
 
 chatmemory = ChatMemoryBuffer.from_defaults(token_limit=8192)
 
@@ -76,8 +72,8 @@ def load_data():
             # Define the directory containing the Markdown files
             markdown_directory = 'markdown'
 
-            # Initialize SimpleDirectoryReader to read Markdown files
-            reader = SimpleDirectoryReader(markdown_directory, required_exts=[".md"])
+            # Initialize SimpleDirectoryReader to read the Markdown files of each product
+            reader = SimpleDirectoryReader(input_files=dataPrimer.product_markdown_files(markdown_directory))
 
             # Load documents from the directory
             documents = reader.load_data(show_progress=True, num_workers=4)
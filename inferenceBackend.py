@@ -0,0 +1,455 @@
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.embeddings.huggingface.utils import (
+    get_query_instruct_for_model_name,
+    get_text_instruct_for_model_name,
+)
+
+EMBED_MODEL_NAME = "nomic-ai/nomic-embed-text-v1"
+RERANK_MODEL_NAME = "BAAI/bge-reranker-base"
+CACHE_FOLDER = './HFCache'
+
+# torch: HuggingFace/FlagEmbedding PyTorch models, onnx: exported fp32 ONNX, onnx-int8: dynamically quantized ONNX
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+DEFAULT_BACKEND = os.environ.get('THALESDOCS_INFERENCE_BACKEND', 'torch')
+
+
+def cpu_threads():
+    """
+    Get the number of threads to use for CPU inference, if overridden.
+
+    PyTorch and ONNX Runtime both default to the number of physical cores, which
+    is usually fastest, so this is only set through THALESDOCS_CPU_THREADS.
+
+    Returns:
+    int: The number of inference threads, or None to keep the library defaults.
+    """
+    if os.environ.get('THALESDOCS_CPU_THREADS'):
+        return int(os.environ['THALESDOCS_CPU_THREADS'])
+    return None
+
+
+def configure_torch_threads():
+    """
+    Apply the THALESDOCS_CPU_THREADS override to PyTorch, if set.
+
+    Returns:
+    None
+    """
+    threads = cpu_threads()
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def onnx_model_path(model_name, quantize=False):
+    """
+    Get the path of the cached ONNX export of a model under the HuggingFace cache folder.
+
+    Parameters:
+    model_name (str): The HuggingFace model name.
+    quantize (bool): Whether to return the int8 quantized model path. Default is False.
+
+    Returns:
+    str: The path of the ONNX model file.
+    """
+    model_dir = os.path.join(CACHE_FOLDER, 'onnx', model_name.replace('/', '--'))
+    return os.path.join(model_dir, 'model_int8.onnx' if quantize else 'model.onnx')
+
+
+def export_onnx(model_name, task, quantize=False, trust_remote_code=False):
+    """
+    Export a HuggingFace model to ONNX (and optionally int8) unless a cached export exists.
+
+    Parameters:
+    model_name (str): The HuggingFace model name.
+    task (str): 'embedding' to export the last hidden state, 'rerank' to export the classification logits.
+    quantize (bool): Whether to also create an int8 dynamically quantized model. Default is False.
+    trust_remote_code (bool): Whether to allow the model's custom code to run. Default is False.
+
+    Returns:
+    str: The path of the ONNX model to load.
+    """
+    path = onnx_model_path(model_name)
+    quantized_path = onnx_model_path(model_name, quantize=True)
+
+    # The model file is only moved into place once the export and tokenizer are complete,
+    # so an interrupted export is redone on the next run instead of being treated as cached
+    if not os.path.exists(path):
+        import torch
+        from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+        print(f"Exporting {model_name} to ONNX: {path}...")
+        auto_class = AutoModel if task == 'embedding' else AutoModelForSequenceClassification
+        tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=CACHE_FOLDER,
+                                                  trust_remote_code=trust_remote_code)
+        model = auto_class.from_pretrained(model_name, cache_dir=CACHE_FOLDER,
+                                           trust_remote_code=trust_remote_code).eval()
+
+        class OutputWrapper(torch.nn.Module):
+            # Export a single tensor output with keyword inputs, whatever the model's forward signature
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask):
+                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
+                return outputs[0]
+
+        output_axes = {0: 'batch', 1: 'sequence'} if task == 'embedding' else {0: 'batch'}
+        dummy = tokenizer(["ThalesDocs ONNX export"], return_tensors='pt')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with torch.no_grad():
+            # The TorchScript exporter handles dynamic_axes and nomic's remote code; newer
+            # torch releases default to the dynamo exporter, which needs onnxscript
+            torch.onnx.export(
+                OutputWrapper(model),
+                (dummy['input_ids'], dummy['attention_mask']),
+                path + '.tmp',
+                input_names=['input_ids', 'attention_mask'],
+                output_names=['output'],
+                dynamic_axes={
+                    'input_ids': {0: 'batch', 1: 'sequence'},
+                    'attention_mask': {0: 'batch', 1: 'sequence'},
+                    'output': output_axes,
+                },
+                opset_version=17,
+                dynamo=False,
+            )
+        tokenizer.save_pretrained(os.path.dirname(path))
+        os.replace(path + '.tmp', path)
+
+    if quantize:
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            print(f"Quantizing {model_name} to int8: {quantized_path}...")
+            quantize_dynamic(path, quantized_path + '.tmp', weight_type=QuantType.QInt8)
+            os.replace(quantized_path + '.tmp', quantized_path)
+        return quantized_path
+
+    return path
+
+
+def create_session(path):
+    """
+    Create an ONNX Runtime CPU session tuned for low-latency single-request inference.
+
+    Parameters:
+    path (str): The path of the ONNX model file.
+
+    Returns:
+    onnxruntime.InferenceSession: The inference session.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # One request runs at a time, so spend the threads inside each operator
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    if cpu_threads():
+        options.intra_op_num_threads = cpu_threads()
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+class ONNXEmbedding(BaseEmbedding):
+    """
+    Sentence embedding model running an ONNX export of a HuggingFace model on ONNX Runtime.
+
+    Uses mean pooling and L2 normalization, matching the sentence-transformers
+    configuration of nomic-embed-text, and the same query/text instructions as
+    HuggingFaceEmbedding so vectors are interchangeable with an index built by it.
+
+    Parameters:
+    model_name (str): The HuggingFace model name.
+    quantize (bool): Whether to use the int8 dynamically quantized model.
+    max_length (int): The maximum number of tokens per text.
+    """
+
+    quantize: bool = Field(default=False, description="Whether the int8 quantized model is used.")
+    max_length: int = Field(default=8192, description="Maximum number of tokens per text.")
+
+    _session = PrivateAttr()
+    _tokenizer = PrivateAttr()
+    _query_instruction = PrivateAttr()
+    _text_instruction = PrivateAttr()
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, quantize=False, max_length=8192, **kwargs):
+        super().__init__(model_name=model_name, quantize=quantize, max_length=max_length, **kwargs)
+        from transformers import AutoTokenizer
+
+        path = export_onnx(model_name, 'embedding', quantize=quantize, trust_remote_code=True)
+        self._session = create_session(path)
+        self._tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(path))
+        self._query_instruction = get_query_instruct_for_model_name(model_name)
+        self._text_instruction = get_text_instruct_for_model_name(model_name)
+
+    @classmethod
+    def class_name(cls):
+        return "ONNXEmbedding"
+
+    def _embed(self, texts):
+        encoded = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                  return_tensors='np')
+        attention_mask = encoded['attention_mask'].astype(np.int64)
+        hidden_state = self._session.run(None, {
+            'input_ids': encoded['input_ids'].astype(np.int64),
+            'attention_mask': attention_mask,
+        })[0]
+
+        # Mean pooling over the non-padding tokens, then L2 normalization
+        mask = attention_mask[..., None].astype(hidden_state.dtype)
+        embeddings = (hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query):
+        return self._embed([self._query_instruction + query])[0]
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed([self._text_instruction + text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._embed([self._text_instruction + text for text in texts])
+
+
+class ONNXReranker(BaseNodePostprocessor):
+    """
+    Cross-encoder reranker running an ONNX export of a HuggingFace model on ONNX Runtime.
+
+    Scores and orders nodes the same way as FlagEmbeddingReranker: the raw
+    relevance logit of each (query, node) pair, highest first.
+
+    Parameters:
+    model (str): The HuggingFace model name.
+    top_n (int): The number of nodes to return.
+    quantize (bool): Whether to use the int8 dynamically quantized model.
+    max_length (int): The maximum number of tokens per (query, node) pair.
+    """
+
+    model: str = Field(default=RERANK_MODEL_NAME, description="Reranker model name.")
+    top_n: int = Field(default=7, description="Number of nodes to return sorted by score.")
+    quantize: bool = Field(default=False, description="Whether the int8 quantized model is used.")
+    max_length: int = Field(default=512, description="Maximum number of tokens per pair.")
+
+    _session = PrivateAttr()
+    _tokenizer = PrivateAttr()
+
+    def __init__(self, model=RERANK_MODEL_NAME, top_n=7, quantize=False, max_length=512, **kwargs):
+        super().__init__(model=model, top_n=top_n, quantize=quantize, max_length=max_length, **kwargs)
+        from transformers import AutoTokenizer
+
+        path = export_onnx(model, 'rerank', quantize=quantize)
+        self._session = create_session(path)
+        self._tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(path))
+
+    @classmethod
+    def class_name(cls):
+        return "ONNXReranker"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+
+        texts = [node.node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        encoded = self._tokenizer([query_bundle.query_str] * len(texts), texts, padding=True,
+                                  truncation=True, max_length=self.max_length, return_tensors='np')
+        logits = self._session.run(None, {
+            'input_ids': encoded['input_ids'].astype(np.int64),
+            'attention_mask': encoded['attention_mask'].astype(np.int64),
+        })[0]
+
+        for node, score in zip(nodes, logits[:, 0]):
+            node.score = float(score)
+
+        return sorted(nodes, key=lambda x: -x.score if x.score else 0)[:self.top_n]
+
+
+def get_embed_model(backend=DEFAULT_BACKEND):
+    """
+    Create the nomic-embed-text embedding model for the selected inference backend.
+
+    Parameters:
+    backend (str): One of 'torch', 'onnx' or 'onnx-int8'. Default is THALESDOCS_INFERENCE_BACKEND or 'torch'.
+
+    Returns:
+    BaseEmbedding: The embedding model.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == 'torch':
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        configure_torch_threads()
+        return HuggingFaceEmbedding(
+            model_name=EMBED_MODEL_NAME, trust_remote_code=True,
+            cache_folder=CACHE_FOLDER
+        )
+
+    return ONNXEmbedding(EMBED_MODEL_NAME, quantize=(backend == 'onnx-int8'))
+
+
+def get_reranker(backend=DEFAULT_BACKEND, top_n=7):
+    """
+    Create the bge reranker for the selected inference backend.
+
+    Parameters:
+    backend (str): One of 'torch', 'onnx' or 'onnx-int8'. Default is THALESDOCS_INFERENCE_BACKEND or 'torch'.
+    top_n (int): The number of nodes to keep after reranking. Default is 7.
+
+    Returns:
+    BaseNodePostprocessor: The reranker.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == 'torch':
+        from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
+
+        configure_torch_threads()
+        return FlagEmbeddingReranker(model=RERANK_MODEL_NAME, top_n=top_n)
+
+    return ONNXReranker(RERANK_MODEL_NAME, top_n=top_n, quantize=(backend == 'onnx-int8'))
+
+
+def load_sample_texts(directory='markdown', limit=32, max_chars=2000):
+    """
+    Load sample passages for the parity check and benchmark from the scraped markdown files.
+
+    Parameters:
+    directory (str): The directory containing markdown files. Default is 'markdown'.
+    limit (int): The maximum number of passages. Default is 32.
+    max_chars (int): The maximum number of characters per passage. Default is 2000.
+
+    Returns:
+    list: A list of passages, or built-in samples if no markdown files are found.
+    """
+    texts = []
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if file.endswith('.md') and len(texts) < limit:
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                    text = f.read(max_chars).strip()
+                if text:
+                    texts.append(text)
+
+    return texts or [
+        "CipherTrust Manager provides centralized key management for encryption keys.",
+        "To create a key, open the Keys page and click Add Key.",
+        "Connectors such as CipherTrust Transparent Encryption protect data at rest.",
+        "Administrators can configure syslog connections to forward audit records.",
+        "Backup keys are used to encrypt system backups of the CipherTrust Manager.",
+        "The REST API requires a bearer token obtained from the auth tokens endpoint.",
+        "High availability clusters replicate configuration between nodes.",
+        "Luna HSM partitions can be used as a root of trust for CipherTrust Manager.",
+    ]
+
+
+def check_parity(backend, texts, query, top_n=7):
+    """
+    Compare an ONNX backend against the PyTorch models.
+
+    Parameters:
+    backend (str): The backend to check, 'onnx' or 'onnx-int8'.
+    texts (list): The passages to embed and rerank.
+    query (str): The query used for the query embedding and reranking.
+    top_n (int): The number of reranked nodes to compare. Default is 7.
+
+    Returns:
+    dict: The minimum and mean embedding cosine similarity and whether the rerank order matches.
+    """
+    reference_embed, candidate_embed = get_embed_model('torch'), get_embed_model(backend)
+    reference = np.array(reference_embed.get_text_embedding_batch(texts) +
+                         [reference_embed.get_query_embedding(query)])
+    candidate = np.array(candidate_embed.get_text_embedding_batch(texts) +
+                         [candidate_embed.get_query_embedding(query)])
+    cosine = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+
+    def rerank_order(reranker):
+        nodes = [NodeWithScore(node=TextNode(text=text, id_=str(i))) for i, text in enumerate(texts)]
+        return [node.node.node_id for node in reranker.postprocess_nodes(nodes, QueryBundle(query))]
+
+    reference_order = rerank_order(get_reranker('torch', top_n))
+    candidate_order = rerank_order(get_reranker(backend, top_n))
+
+    return {
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'rerank_order_match': reference_order == candidate_order,
+        'rerank_top_n_overlap': len(set(reference_order) & set(candidate_order)) / max(len(reference_order), 1),
+    }
+
+
+def benchmark(backend, texts, query, repeats=20, top_n=7):
+    """
+    Measure query-time latency of the embedder and reranker for a backend.
+
+    Parameters:
+    backend (str): The backend to benchmark.
+    texts (list): The passages to rerank.
+    query (str): The query to embed and rerank with.
+    repeats (int): The number of timed runs. Default is 20.
+    top_n (int): The number of nodes kept by the reranker. Default is 7.
+
+    Returns:
+    dict: The median and p95 latency in milliseconds for query embedding and reranking.
+    """
+    embed_model, reranker = get_embed_model(backend), get_reranker(backend, top_n)
+    nodes = [NodeWithScore(node=TextNode(text=text)) for text in texts]
+
+    def timed(fn):
+        fn()  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+    embed_p50, embed_p95 = timed(lambda: embed_model.get_query_embedding(query))
+    rerank_p50, rerank_p95 = timed(lambda: reranker.postprocess_nodes(nodes, QueryBundle(query)))
+
+    return {
+        'embed_p50_ms': embed_p50, 'embed_p95_ms': embed_p95,
+        'rerank_p50_ms': rerank_p50, 'rerank_p95_ms': rerank_p95,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check parity and benchmark the inference backends.')
+    parser.add_argument('--backend', choices=BACKENDS[1:], default='onnx', help='ONNX backend to check against torch')
+    parser.add_argument('--query', default='How do I create a key in CipherTrust Manager?', help='Query to test with')
+    parser.add_argument('--repeats', type=int, default=20, help='Number of timed runs per model')
+    parser.add_argument('--min-cosine', type=float, default=0.99, help='Minimum embedding cosine similarity to pass')
+    args = parser.parse_args()
+
+    texts = load_sample_texts()
+    print(f"Using {len(texts)} passages, {cpu_threads() or 'default'} CPU threads")
+
+    parity = check_parity(args.backend, texts, args.query)
+    print(f"Parity ({args.backend} vs torch): {parity}")
+
+    for backend in ('torch', args.backend):
+        print(f"Latency ({backend}): {benchmark(backend, texts, args.query, args.repeats)}")
+
+    if parity['min_cosine'] < args.min_cosine or not parity['rerank_order_match']:
+        raise SystemExit(f"Parity check failed for backend '{args.backend}'")
+    print("Parity check passed")